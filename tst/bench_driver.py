@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""benchmark the driver against the in-process fake k8s API server (no minikube needed).
+
+For each namespace size, a synthetic namespace with that many deployments is created and the driver is run:
+    query     - ./adjust --query
+    adjust    - ./adjust with a cpu change for every deployment (settlement disabled)
+    settle    - same as 'adjust', followed by a settlement period
+For each phase, the wall time, the number of API requests issued (watch events are counted separately) and the
+number of bytes sent by the API server are reported.
+
+Usage:
+    cd tst; python3 bench_driver.py [--sizes 1,10,100,500] [--replicas 1] [--settlement 2] [--concurrent]
+"""
+
+import argparse
+import json
+import time
+
+from fake_k8s import FakeK8s
+from helpers import fake_driver
+
+PHASES = ("query", "adjust", "settle")
+
+
+def make_cfg(names, concurrent):
+    cfg = {
+        "k8s": {
+            "concurrent_adjust": concurrent,
+            "application": {
+                "components": {n: {"settings": {"cpu": {"min": 0.1, "max": 1, "step": 0.1}}} for n in names}
+            },
+        }
+    }
+    return json.dumps(cfg)  # yaml is a superset of json
+
+
+def run_phase(k8s, cfg, phase, names, cpu, settlement):
+    k8s.reset_stats()
+    t0 = time.time()
+    if phase == "query":
+        fake_driver(k8s, cfg, "--query default")
+    else:
+        inp = {"application": {"components": {n: {"settings": {"cpu": {"value": cpu}}} for n in names}}}
+        if phase == "settle":
+            inp["control"] = {"settlement": settlement}
+        fake_driver(k8s, cfg, "default", inp)
+    dt = time.time() - t0
+    stats = k8s.stats
+    events = stats["by_type"].get("watch-event", 0)
+    return dt, stats["requests"] - events, events, stats["bytes"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the servo-k8s driver against a fake k8s API server")
+    parser.add_argument("--sizes", default="1,10,100,500", help="comma-separated list of deployment counts")
+    parser.add_argument("--replicas", type=int, default=1, help="replicas per deployment")
+    parser.add_argument("--pod-start-delay", type=float, default=0.2, help="seconds until a new pod becomes ready")
+    parser.add_argument("--settlement", type=int, default=2, help="settlement time (seconds) for the 'settle' phase")
+    parser.add_argument("--concurrent", action="store_true", help="set concurrent_adjust in the driver config")
+    parser.add_argument("--phases", default=",".join(PHASES), help="comma-separated list of phases to run")
+    parser.add_argument("--json", action="store_true", help="print results as json, one line per phase")
+    args = parser.parse_args()
+
+    phases = args.phases.split(",")
+    if not args.json:
+        print("{:>6} {:>8} {:>10} {:>9} {:>8} {:>12}".format("deps", "phase", "wall(s)", "requests", "events", "bytes"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        with FakeK8s(pod_start_delay=args.pod_start_delay) as k8s:
+            names = k8s.add_app("default", size, replicas=args.replicas)
+            if not k8s.wait_stable(timeout=max(30, size)):
+                raise Exception("fake k8s did not become stable with {} deployments".format(size))
+            cfg = make_cfg(names, args.concurrent)
+            cpu = 0.2
+            for phase in phases:
+                dt, requests, events, nbytes = run_phase(k8s, cfg, phase, names, cpu, args.settlement)
+                cpu = round(cpu + 0.1, 1)  # each adjust phase should change something
+                if args.json:
+                    r = {"deps": size, "phase": phase, "wall": dt, "requests": requests, "events": events}
+                    r["bytes"] = nbytes
+                    print(json.dumps(r))
+                else:
+                    print("{:>6} {:>8} {:>10.2f} {:>9} {:>8} {:>12}".format(size, phase, dt, requests, events, nbytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""micro-benchmark of the spec hashing used for spec_id/version_id/runtime_id: compares the driver's get_hash()
+and cached spec_hash() with the original implementation (a per-item hasher.update() walk, copied below) on
+synthetic pod template specs, and checks that the digests are identical.
+
+Usage:
+    cd tst; python3 bench_hash.py [--containers 20] [--env 50] [--repeat 200]
+"""
+
+import argparse
+import hashlib
+import timeit
+
+from helpers import load_driver
+
+
+# the original implementation (servo-k8s 1.2), for reference
+def orig_get_hash(data):
+    hasher = hashlib.md5()
+    orig_dump_container(data, hasher.update)
+    return hasher.hexdigest()
+
+
+def orig_dump_container(c, func):
+    if isinstance(c, dict):  # dict
+        func("{".encode("utf-8"))
+        for k in sorted(c):  # for all repeatable
+            func("{}:".format(k).encode("utf-8"))
+            orig_dump_container(c[k], func)
+            func(",".encode("utf-8"))
+        func("}".encode("utf-8"))
+    elif isinstance(c, list):  # list
+        func("[".encode("utf-8"))
+        for k in c:  # for all repeatable
+            orig_dump_container(k, func)
+            func(",".encode("utf-8"))
+        func("]".encode("utf-8"))
+    else:  # everything else
+        if isinstance(c, type(b"")):
+            pass  # already a stream, keep as is
+        elif isinstance(c, str):
+            # encode to stream explicitly here to avoid implicit encoding to ascii
+            c = c.encode("utf-8")
+        else:
+            c = str(c).encode("utf-8")  # convert to string (e.g., if integer)
+        func(c)  # simple value, string or convertible-to-string
+
+
+def make_spec(containers, env):
+    def container(i):
+        return {
+            "name": "c{}".format(i),
+            "image": "registry.example.com/app/c{}:1.{}".format(i, i),
+            "args": ["--port", 8080 + i, "--verbose", True, "--ratio", 0.5],
+            "env": [{"name": "VAR_{}".format(j), "value": "välue-{}".format(j)} for j in range(env)]
+            + [{"name": "POD_IP", "valueFrom": {"fieldRef": {"fieldPath": "status.podIP"}}}],
+            "resources": {"limits": {"cpu": "500m", "memory": "1Gi"}, "requests": {"cpu": 0.25, "memory": None}},
+            "ports": [{"containerPort": 8080 + i, "protocol": "TCP"}],
+            "readinessProbe": {"httpGet": {"path": "/healthz", "port": 8080 + i}, "periodSeconds": 5},
+        }
+
+    return {
+        "containers": [container(i) for i in range(containers)],
+        "volumes": [{"name": "v{}".format(i), "configMap": {"name": "cm{}".format(i)}} for i in range(containers)],
+        "nodeSelector": {"kubernetes.io/os": "linux"},
+        "terminationGracePeriodSeconds": 30,
+        "empty": {},
+        "none": [],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark spec hashing")
+    parser.add_argument("--containers", type=int, default=20, help="containers per pod spec")
+    parser.add_argument("--env", type=int, default=50, help="env vars per container")
+    parser.add_argument("--repeat", type=int, default=200, help="number of hashes timed")
+    args = parser.parse_args()
+
+    drv = load_driver()
+    spec = make_spec(args.containers, args.env)
+    dep = {"metadata": {"uid": "u1", "generation": 1}, "spec": {"template": {"spec": spec}}}
+    specs = [spec, make_spec(2, 3)]
+    other = {"a": [1, 2.5, None, True, b"raw", "ü", {3: {"x": []}, 1: 0}], "runtime": {"web": ["u1", "u2"]}}
+
+    # same digests as the original implementation
+    for data in (spec, specs, other, [], {}, "", 0):
+        assert drv.get_hash(data) == orig_get_hash(data), data
+    assert drv.spec_hash(dep) == orig_get_hash(spec)
+    assert drv.get_list_hash([drv.serialize(s) for s in specs]) == orig_get_hash(specs)
+    assert drv.get_list_hash([]) == orig_get_hash([])
+
+    size = len(drv.serialize(spec))
+    t_orig = timeit.timeit(lambda: orig_get_hash(spec), number=args.repeat) / args.repeat
+    t_new = timeit.timeit(lambda: drv.get_hash(spec), number=args.repeat) / args.repeat
+    t_cached = timeit.timeit(lambda: drv.spec_hash(dep), number=args.repeat) / args.repeat
+    print(
+        "pod spec: {} containers x {} env vars, {} bytes serialized; digests identical".format(
+            args.containers, args.env, size
+        )
+    )
+    print("{:<24} {:>10.3f} ms".format("original get_hash", t_orig * 1000))
+    print("{:<24} {:>10.3f} ms  ({:.1f}x)".format("get_hash", t_new * 1000, t_orig / t_new))
+    print("{:<24} {:>10.3f} ms  ({:.0f}x)".format("spec_hash (cached)", t_cached * 1000, t_orig / t_cached))
+
+
+if __name__ == "__main__":
+    main()
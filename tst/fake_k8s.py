@@ -0,0 +1,1139 @@
+"""In-process stand-in for the k8s API server, for offline tests and benchmarks of the driver.
+
+Serves Deployments, ReplicaSets and Pods over HTTP (the subset of the API used by the driver: get, list with
+label/field selectors, watch, patch, delete) and runs a simple controller loop that simulates rollouts: a change
+of a deployment's pod template creates a new ReplicaSet, pods are created for it and become ready after a delay,
+old ReplicaSets are scaled down. Deployment status (observedGeneration, replica counts, conditions) follows
+the same rules as the real deployment controller closely enough for the driver's progress tracking.
+StatefulSets and DaemonSets are simulated as well (see add_statefulset() and add_daemonset()), with their
+revisions kept as ControllerRevisions. HorizontalPodAutoscalers scale their target to the replica count set
+with scale_hpa(), within their bounds (see add_hpa()).
+
+Failures can be injected in new pods with a pod template annotation, or with a function passed to
+FakeK8s(fail=...) that gets the new pod object and returns the failure mode (or None):
+    fake.k8s/fail: crash       - the containers keep restarting (CrashLoopBackOff)
+    fake.k8s/fail: image-pull  - the image cannot be pulled (ImagePullBackOff)
+    fake.k8s/fail: never-ready - the pods run, but never become ready
+    fake.k8s/fail: unschedulable - the pods stay Pending, not scheduled to a node
+    fake.k8s/fail: late-scheduled - the pods start (and become ready 1s later), with the FailedScheduling event
+                   of a pod that was unschedulable for 70s (e.g., until the cluster added a node)
+    fake.k8s/fail: pull-retried - the pods start (and become ready 1s later), with the Failed event of a first
+                   image pull attempt
+Failing pods also get the Warning events that the kubelet or the scheduler would report.
+
+Nodes are optional (see add_node()): with nodes, new pods are scheduled by their resource requests and stay
+Pending as 'unschedulable' when they don't fit; without, pods run without a node. ResourceQuotas (with their
+usage) and LimitRanges can be added, but are not enforced.
+
+Usage:
+    with FakeK8s(pod_start_delay=0.2) as k8s:
+        k8s.add_deployment("default", "web", replicas=3)
+        ... run the driver with OPTUNE_K8S_SERVER=k8s.url ...
+        print(k8s.stats)
+"""
+
+import bisect
+import copy
+import datetime
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FAIL_ANN = "fake.k8s/fail"
+
+# (API group path, resource) -> kind
+KINDS = {
+    ("apis/apps/v1", "deployments"): "Deployment",
+    ("apis/apps/v1", "replicasets"): "ReplicaSet",
+    ("apis/apps/v1", "statefulsets"): "StatefulSet",
+    ("apis/apps/v1", "daemonsets"): "DaemonSet",
+    ("apis/apps/v1", "controllerrevisions"): "ControllerRevision",
+    ("api/v1", "pods"): "Pod",
+    ("api/v1", "events"): "Event",
+    ("api/v1", "nodes"): "Node",
+    ("api/v1", "resourcequotas"): "ResourceQuota",
+    ("api/v1", "limitranges"): "LimitRange",
+    ("apis/autoscaling/v1", "horizontalpodautoscalers"): "HorizontalPodAutoscaler",
+}
+API_VERSIONS = {"Deployment": "apps/v1", "ReplicaSet": "apps/v1", "Pod": "v1", "Event": "v1", "Node": "v1"}
+API_VERSIONS.update({"ResourceQuota": "v1", "LimitRange": "v1"})
+API_VERSIONS.update({"StatefulSet": "apps/v1", "DaemonSet": "apps/v1", "ControllerRevision": "apps/v1"})
+API_VERSIONS.update({"HorizontalPodAutoscaler": "autoscaling/v1"})
+REVISION_HASH = "controller-revision-hash"
+TEMPLATE_GENERATION = "deprecated.daemonset.template.generation"
+
+# lists merged by the 'name' key in a strategic merge patch (all other lists are replaced)
+MERGE_BY_NAME = ("containers", "initContainers", "env", "volumes", "volumeMounts", "ports")
+
+
+def now(ago=0):
+    t = datetime.datetime.utcnow() - datetime.timedelta(seconds=ago)
+    return t.isoformat(timespec="seconds") + "Z"
+
+
+def strategic_merge(obj, patch, key=None):
+    """apply a strategic merge patch (simplified: lists of named items are merged by name, None deletes)"""
+    if isinstance(patch, dict) and isinstance(obj, dict):
+        r = dict(obj)
+        for k, v in patch.items():
+            if v is None:
+                r.pop(k, None)
+            elif k in r:
+                r[k] = strategic_merge(r[k], v, k)
+            else:
+                r[k] = strategic_merge({}, v, k) if isinstance(v, dict) else copy.deepcopy(v)
+        return r
+    if isinstance(patch, list) and isinstance(obj, list) and key in MERGE_BY_NAME:
+        r = [copy.deepcopy(i) for i in obj]
+        names = {i.get("name"): n for n, i in enumerate(r)}
+        for item in patch:
+            if item.get("name") in names:
+                n = names[item["name"]]
+                r[n] = strategic_merge(r[n], item, None)
+            else:
+                r.append(copy.deepcopy(item))
+        return r
+    return copy.deepcopy(patch)
+
+
+def merge_patch(obj, patch):
+    """RFC 7386 JSON merge patch"""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    r = dict(obj) if isinstance(obj, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            r.pop(k, None)
+        else:
+            r[k] = merge_patch(r.get(k), v)
+    return r
+
+
+def json_patch(obj, ops):
+    """RFC 6902 JSON patch (add, replace, remove and test operations only)"""
+    obj = copy.deepcopy(obj)
+    for op in ops:
+        keys = [k.replace("~1", "/").replace("~0", "~") for k in op["path"].split("/")[1:]]
+        parent = obj
+        for k in keys[:-1]:
+            parent = parent[int(k)] if isinstance(parent, list) else parent[k]
+        last = keys[-1]
+        if isinstance(parent, list):
+            last = len(parent) if last == "-" else int(last)
+        if op["op"] == "test":
+            if parent[last] != op["value"]:
+                raise ValueError("test operation failed for {}".format(op["path"]))
+        elif op["op"] == "remove":
+            del parent[last]
+        elif op["op"] == "add" and isinstance(parent, list):
+            parent.insert(last, op["value"])
+        elif op["op"] in ("add", "replace"):
+            parent[last] = op["value"]
+        else:
+            raise ValueError("unsupported json patch op {}".format(op["op"]))
+    return obj
+
+
+def match_labels(obj, selector):
+    """label selector: equality-based ('a=b,c!=d') and set-based 'in'/'notin' terms ('a in (b,c)')"""
+    if not selector:
+        return True
+    labels = obj["metadata"].get("labels") or {}
+    for term in re.split(r",(?![^(]*\))", selector):
+        m = re.match(r"\s*([^\s!=]+)\s+(in|notin)\s+\((.*)\)\s*$", term)
+        if m:
+            values = [v.strip() for v in m.group(3).split(",")]
+            if (labels.get(m.group(1)) in values) != (m.group(2) == "in"):
+                return False
+            continue
+        neg = "!=" in term
+        k, _, v = term.partition("!=" if neg else "=")
+        if (labels.get(k.strip()) == v.lstrip("=").strip()) == neg:
+            return False
+    return True
+
+
+def match_fields(obj, selector):
+    """field selector: only metadata.name and metadata.namespace (with = and !=) are supported"""
+    if not selector:
+        return True
+    for term in selector.split(","):
+        neg = "!=" in term
+        k, v = term.split("!=" if neg else "=", 1)
+        cur = obj
+        for p in k.strip().split("."):
+            cur = (cur or {}).get(p)
+        if (cur == v.strip()) == neg:
+            return False
+    return True
+
+
+QUANTITY_UNITS = {"": 1, "m": 0.001, "Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40}
+
+
+def parse_quantity(q):
+    """a resource quantity as a number (only plain numbers, 'm' or binary suffix), None if not valid"""
+    m = re.match(r"^(-?[0-9.]+)(m|Ki|Mi|Gi|Ti)?$", str(q))
+    return float(m.group(1)) * QUANTITY_UNITS[m.group(2) or ""] if m else None
+
+
+def pod_requests(spec, typ="requests"):
+    """the cpu and memory requests (or limits) of a pod spec (a container's limit if it has no request)"""
+    total = {"cpu": 0.0, "memory": 0.0}
+    for c in spec.get("containers", []):
+        res = c.get("resources") or {}
+        for r in total:
+            q = (res.get("limits") or {}).get(r)
+            if typ == "requests":
+                q = (res.get("requests") or {}).get(r, q)
+            total[r] += parse_quantity(q) or 0.0
+    return total
+
+
+def validate_deployment(dep):
+    """raise ValueError for the invalid deployment specs that the driver could produce: negative resource
+    quantities and requests above limits (the quantities are only checked as plain numbers, 'm' or binary suffix)"""
+    for c in dep["spec"]["template"]["spec"].get("containers", []):
+        resources = c.get("resources") or {}
+        parsed = {}
+        for typ in ("limits", "requests"):
+            for rname, q in (resources.get(typ) or {}).items():
+                v = parse_quantity(q)
+                if v is None or v < 0:
+                    raise ValueError("{}.resources.{}.{}: Invalid value: {!r}".format(c["name"], typ, rname, q))
+                parsed[(typ, rname)] = v
+        for (typ, rname), v in parsed.items():
+            if typ == "requests" and v > parsed.get(("limits", rname), v):
+                raise ValueError(
+                    "{}.resources.requests.{}: must be less than or equal to limit".format(c["name"], rname)
+                )
+
+
+def template_hash(template):
+    return hashlib.md5(json.dumps(template, sort_keys=True).encode()).hexdigest()[:10]
+
+
+class Store(object):
+    """object store with a global resourceVersion, an index by owner UID and an event log for watches"""
+
+    MAX_EVENTS = 50000
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.cond = threading.Condition(self.lock)
+        self.objects = {}  # (kind, namespace, name) -> obj
+        self.owned = {}  # owner uid -> {key: obj}
+        self.rv = 1
+        self.events = []  # (rv, type, kind, namespace, labels, json), ordered by rv
+        self.first_rv = 1  # oldest resourceVersion that can be watched from
+
+    def _emit(self, typ, obj):
+        self.rv += 1
+        obj["metadata"]["resourceVersion"] = str(self.rv)
+        md = obj["metadata"]
+        self.events.append((self.rv, typ, obj["kind"], md["namespace"], md.get("labels"), json.dumps(clean(obj))))
+        if len(self.events) > self.MAX_EVENTS:
+            del self.events[: self.MAX_EVENTS // 2]
+            self.first_rv = self.events[0][0] - 1
+        self.cond.notify_all()
+
+    def events_after(self, rv):
+        return self.events[bisect.bisect_right(self.events, (rv, "\xff")) :]
+
+    def put(self, obj):
+        with self.lock:
+            key = (obj["kind"], obj["metadata"]["namespace"], obj["metadata"]["name"])
+            old = self.objects.get(key)
+            if old is not None:
+                self._unindex(key, old)
+            self.objects[key] = obj
+            for ref in obj["metadata"].get("ownerReferences", []):
+                self.owned.setdefault(ref["uid"], {})[key] = obj
+            self._emit("MODIFIED" if old is not None else "ADDED", obj)
+
+    def _unindex(self, key, obj):
+        for ref in obj["metadata"].get("ownerReferences", []):
+            self.owned.get(ref["uid"], {}).pop(key, None)
+
+    def delete(self, kind, namespace, name):
+        with self.lock:
+            obj = self.objects.pop((kind, namespace, name), None)
+            if obj:
+                self._unindex((kind, namespace, name), obj)
+                self._emit("DELETED", obj)
+
+    def get(self, kind, namespace, name):
+        return self.objects.get((kind, namespace, name))
+
+    def list(self, kind, namespace=None):
+        return [o for (k, ns, _), o in sorted(self.objects.items()) if k == kind and namespace in (None, ns)]
+
+    def owned_by(self, kind, owner):
+        return [o for (k, _, _), o in sorted(self.owned.get(owner["metadata"]["uid"], {}).items()) if k == kind]
+
+
+class FakeK8s(object):
+    def __init__(self, pod_start_delay=0.1, tick=0.02, fail=None):
+        self.store = Store()
+        self.pod_start_delay = pod_start_delay
+        self.fail = fail  # optional function(pod) -> failure mode (see FAIL_ANN) or None
+        self.hpa_metrics = {}  # (namespace, HPA name) -> replicas wanted by its metrics, see scale_hpa()
+        self.broken_watches = 0  # this many of the next watch streams are cut after a truncated event
+        self.unavailable = False  # while set, all requests fail with 503 and the watch streams are ended
+        self.forbidden = set()  # kinds (e.g., "Event") that can't be read: 403 for their gets, lists and watches
+        self.tick = tick
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+        self._stop = threading.Event()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    # === setup helpers
+
+    def add_deployment(self, namespace, name, replicas=1, containers=None, labels=None, annotations=None):
+        spec = {
+            "replicas": replicas,
+            "strategy": {"type": "RollingUpdate", "rollingUpdate": {"maxSurge": "25%", "maxUnavailable": "25%"}},
+        }
+        return self._add_workload("Deployment", namespace, name, spec, containers, labels, annotations)
+
+    def add_statefulset(self, namespace, name, replicas=1, containers=None, labels=None):
+        """add a StatefulSet (OrderedReady pod management, RollingUpdate without partition): pods <name>-<N> are
+        created one at a time, each after the previous one is ready, and updated in reverse order, one at a time,
+        only while all pods are ready"""
+        spec = {
+            "replicas": replicas,
+            "serviceName": name,
+            "podManagementPolicy": "OrderedReady",
+            "updateStrategy": {"type": "RollingUpdate", "rollingUpdate": {"partition": 0}},
+        }
+        return self._add_workload("StatefulSet", namespace, name, spec, containers, labels)
+
+    def add_daemonset(self, namespace, name, containers=None, labels=None):
+        """add a DaemonSet: a pod runs on each node that matches its nodeSelector (pods are not checked against
+        the nodes' capacity); old pods that aren't ready are replaced right away, the others one at a time, only
+        while all pods are ready"""
+        spec = {"updateStrategy": {"type": "RollingUpdate", "rollingUpdate": {"maxUnavailable": 1}}}
+        return self._add_workload("DaemonSet", namespace, name, spec, containers, labels)
+
+    def _add_workload(self, kind, namespace, name, spec, containers=None, labels=None, annotations=None):
+        labels = labels or {"app": name}
+        containers = containers or [
+            {
+                "name": "main",
+                "image": "nginx:1.19",
+                "resources": {
+                    "limits": {"cpu": "250m", "memory": "256Mi"},
+                    "requests": {"cpu": "250m", "memory": "256Mi"},
+                },
+            }
+        ]
+        dep = {
+            "apiVersion": "apps/v1",
+            "kind": kind,
+            "metadata": {
+                "name": name,
+                "namespace": namespace,
+                "uid": str(uuid.uuid4()),
+                "generation": 1,
+                "labels": dict(labels),
+                "annotations": dict(annotations or {}),
+                "creationTimestamp": now(),
+            },
+            "spec": dict(
+                spec,
+                selector={"matchLabels": dict(labels)},
+                template={"metadata": {"labels": dict(labels)}, "spec": {"containers": containers}},
+            ),
+            "status": {"observedGeneration": 0, "conditions": []},
+        }
+        self.store.put(dep)
+        return dep
+
+    def add_node(self, name, cpu="4", memory="8Gi", pods=110, labels=None, taints=None):
+        """add a Ready node: once there are nodes, new pods are scheduled to the first one with enough free
+        allocatable cpu and memory (by requests), or stay Pending as 'unschedulable' if none has"""
+        node = {
+            "apiVersion": "v1",
+            "kind": "Node",
+            "metadata": {
+                "name": name,
+                "namespace": None,
+                "uid": str(uuid.uuid4()),
+                "labels": dict(labels or {}, **{"kubernetes.io/hostname": name}),
+                "creationTimestamp": now(),
+            },
+            "spec": {"taints": list(taints or [])},
+            "status": {
+                "allocatable": {"cpu": cpu, "memory": memory, "pods": str(pods)},
+                "conditions": [{"type": "Ready", "status": "True", "reason": "KubeletReady"}],
+            },
+        }
+        self.store.put(node)
+        return node
+
+    def add_quota(self, namespace, name, hard):
+        """add a ResourceQuota (no scopes); its status.used is kept current for the pods of the namespace (the
+        quota is not enforced)"""
+        quota = {
+            "apiVersion": "v1",
+            "kind": "ResourceQuota",
+            "metadata": {"name": name, "namespace": namespace, "uid": str(uuid.uuid4()), "creationTimestamp": now()},
+            "spec": {"hard": dict(hard)},
+            "status": {"hard": dict(hard), "used": {}},
+        }
+        self.store.put(quota)
+        return quota
+
+    def add_limit_range(self, namespace, name, limits):
+        """add a LimitRange with the given 'limits' items (not enforced)"""
+        lr = {
+            "apiVersion": "v1",
+            "kind": "LimitRange",
+            "metadata": {"name": name, "namespace": namespace, "uid": str(uuid.uuid4()), "creationTimestamp": now()},
+            "spec": {"limits": list(limits)},
+        }
+        self.store.put(lr)
+        return lr
+
+    def add_hpa(self, namespace, name, target, min_replicas=1, max_replicas=10, kind="Deployment"):
+        """add a HorizontalPodAutoscaler (autoscaling/v1) for the workload 'target': it keeps the replicas of
+        the workload at what its metrics ask for (see scale_hpa(), the current count if not set), within
+        [minReplicas, maxReplicas]. Unlike k8s, it acts right away (no sync period)."""
+        hpa = {
+            "apiVersion": "autoscaling/v1",
+            "kind": "HorizontalPodAutoscaler",
+            "metadata": {
+                "name": name,
+                "namespace": namespace,
+                "uid": str(uuid.uuid4()),
+                "creationTimestamp": now(),
+                "generation": 1,
+            },
+            "spec": {
+                "scaleTargetRef": {"apiVersion": API_VERSIONS[kind], "kind": kind, "name": target},
+                "minReplicas": min_replicas,
+                "maxReplicas": max_replicas,
+            },
+            "status": {},
+        }
+        self.store.put(hpa)
+        return hpa
+
+    def scale_hpa(self, namespace, name, replicas):
+        """simulate a change in the metrics of an HPA: they ask for 'replicas' from now on"""
+        with self.store.lock:
+            self.hpa_metrics[(namespace, name)] = replicas
+
+    def _schedule(self, pod):
+        """assign a node to a new pod, return False if it doesn't fit on any"""
+        nodes = self.store.list("Node")
+        if not nodes or pod["spec"].get("nodeName"):
+            return True
+        need = pod_requests(pod["spec"])
+        for node in nodes:
+            alloc = node["status"]["allocatable"]
+            placed = [p for p in self.store.list("Pod") if p["spec"].get("nodeName") == node["metadata"]["name"]]
+            if len(placed) >= int(alloc["pods"]):
+                continue
+            used = [pod_requests(p["spec"]) for p in placed]
+            if all(sum(u[r] for u in used) + need[r] <= parse_quantity(alloc[r]) + 1e-9 for r in need):
+                pod["spec"]["nodeName"] = node["metadata"]["name"]
+                return True
+        return False
+
+    def add_app(self, namespace, count, replicas=1, prefix="app"):
+        """add 'count' deployments named <prefix>-<N>, return their names"""
+        names = ["{}-{}".format(prefix, i) for i in range(count)]
+        for name in names:
+            self.add_deployment(namespace, name, replicas=replicas)
+        return names
+
+    def wait_stable(self, timeout=30):
+        """wait until all deployments, statefulsets and daemonsets have completed their rollouts"""
+        t_end = time.time() + timeout
+        while time.time() < t_end:
+            with self.store.lock:
+                deps = self.store.list("Deployment")
+                others = self.store.list("StatefulSet") + self.store.list("DaemonSet")
+                if all(self._dep_complete(d) for d in deps) and all(self._workload_complete(o) for o in others):
+                    return True
+            time.sleep(self.tick)
+        return False
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {"requests": 0, "bytes": 0, "by_type": {}}
+
+    def _count(self, typ, nbytes):
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            self.stats["bytes"] += nbytes
+            self.stats["by_type"][typ] = self.stats["by_type"].get(typ, 0) + 1
+
+    # === lifecycle
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+            threading.Thread(target=self._controller, daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self.store.lock:
+            self.store.cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    # === simulated controllers
+
+    def _controller(self):
+        while not self._stop.is_set():
+            with self.store.lock:
+                for hpa in self.store.list("HorizontalPodAutoscaler"):
+                    self._reconcile_hpa(hpa)
+                for dep in self.store.list("Deployment"):
+                    self._reconcile_deployment(dep)
+                for rs in self.store.list("ReplicaSet"):
+                    self._reconcile_rs(rs)
+                for sts in self.store.list("StatefulSet"):
+                    self._reconcile_statefulset(sts)
+                for ds in self.store.list("DaemonSet"):
+                    self._reconcile_daemonset(ds)
+                for pod in self.store.list("Pod"):
+                    self._reconcile_pod(pod)
+                for dep in self.store.list("Deployment"):
+                    self._update_dep_status(dep)
+                for quota in self.store.list("ResourceQuota"):
+                    self._update_quota_status(quota)
+            self._stop.wait(self.tick)
+
+    def _owned(self, kind, owner):
+        return self.store.owned_by(kind, owner)
+
+    def _owner_ref(self, owner):
+        return {
+            "apiVersion": API_VERSIONS[owner["kind"]],
+            "kind": owner["kind"],
+            "name": owner["metadata"]["name"],
+            "uid": owner["metadata"]["uid"],
+            "controller": True,
+        }
+
+    def _reconcile_deployment(self, dep):
+        ns = dep["metadata"]["namespace"]
+        tmpl = dep["spec"]["template"]
+        h = template_hash(tmpl)
+        rss = self._owned("ReplicaSet", dep)
+        new_rs = next((r for r in rss if r["metadata"]["labels"].get("pod-template-hash") == h), None)
+        changed = False
+        if new_rs is None:
+            rev = max([int(r["metadata"]["annotations"]["deployment.kubernetes.io/revision"]) for r in rss] + [0]) + 1
+            labels = dict(tmpl["metadata"].get("labels", {}), **{"pod-template-hash": h})
+            new_rs = {
+                "apiVersion": "apps/v1",
+                "kind": "ReplicaSet",
+                "metadata": {
+                    "name": "{}-{}".format(dep["metadata"]["name"], h),
+                    "namespace": ns,
+                    "uid": str(uuid.uuid4()),
+                    "labels": labels,
+                    "annotations": {"deployment.kubernetes.io/revision": str(rev)},
+                    "ownerReferences": [self._owner_ref(dep)],
+                    "generation": 1,
+                },
+                "spec": {
+                    "replicas": dep["spec"]["replicas"],
+                    "selector": {"matchLabels": labels},
+                    "template": dict(copy.deepcopy(tmpl), metadata=dict(tmpl.get("metadata", {}), labels=labels)),
+                },
+                "status": {"replicas": 0, "readyReplicas": 0, "availableReplicas": 0, "observedGeneration": 1},
+            }
+            self.store.put(new_rs)
+            changed = True
+        else:
+            # back to the template of an older replicaset (e.g., a rollback): it becomes the latest revision again
+            revs = [int(r["metadata"]["annotations"]["deployment.kubernetes.io/revision"]) for r in rss]
+            ann = new_rs["metadata"]["annotations"]
+            if int(ann["deployment.kubernetes.io/revision"]) < max(revs):
+                ann["deployment.kubernetes.io/revision"] = str(max(revs) + 1)
+                self.store.put(new_rs)
+                changed = True
+            if new_rs["spec"]["replicas"] != dep["spec"]["replicas"]:
+                new_rs["spec"]["replicas"] = dep["spec"]["replicas"]
+                self.store.put(new_rs)
+                changed = True
+        rev = new_rs["metadata"]["annotations"]["deployment.kubernetes.io/revision"]
+        if dep["metadata"].setdefault("annotations", {}).get("deployment.kubernetes.io/revision") != rev:
+            dep["metadata"]["annotations"]["deployment.kubernetes.io/revision"] = rev
+            changed = True
+        # old replica sets are scaled down once the new one is ready (simplified rolling update)
+        new_ready = new_rs["status"].get("readyReplicas", 0) >= new_rs["spec"]["replicas"]
+        for rs in rss:
+            if rs is not new_rs and rs["spec"]["replicas"] != 0 and new_ready:
+                rs["spec"]["replicas"] = 0
+                self.store.put(rs)
+        if dep["status"].get("observedGeneration") != dep["metadata"]["generation"]:
+            dep["status"]["observedGeneration"] = dep["metadata"]["generation"]
+            changed = True
+        if changed:
+            self._set_condition(dep, "Progressing", "True", "ReplicaSetUpdated", "ReplicaSet is progressing.")
+            self.store.put(dep)
+
+    def _reconcile_hpa(self, hpa):
+        ns, spec = hpa["metadata"]["namespace"], hpa["spec"]
+        target = self.store.get(spec["scaleTargetRef"]["kind"], ns, spec["scaleTargetRef"]["name"])
+        if target is None:
+            return
+        current = target["spec"]["replicas"]
+        want = self.hpa_metrics.get((ns, hpa["metadata"]["name"]), current)
+        want = max(spec.get("minReplicas", 1), min(spec["maxReplicas"], want))
+        if want != current:
+            md = dict(target["metadata"], generation=target["metadata"]["generation"] + 1)
+            self.store.put(dict(target, metadata=md, spec=dict(target["spec"], replicas=want)))
+        status = {"currentReplicas": current, "desiredReplicas": want}
+        if hpa["status"] != status:
+            hpa["status"] = status
+            self.store.put(hpa)
+
+    def _reconcile_rs(self, rs):
+        pods = [p for p in self._owned("Pod", rs) if not p["metadata"].get("deletionTimestamp")]
+        want = rs["spec"]["replicas"]
+        for _ in range(want - len(pods)):
+            self._create_pod(rs)
+        for pod in pods[want:]:
+            self.store.delete("Pod", pod["metadata"]["namespace"], pod["metadata"]["name"])
+        pods = self._owned("Pod", rs)
+        ready = sum(1 for p in pods if self._pod_ready(p))
+        st = {"replicas": len(pods), "readyReplicas": ready, "availableReplicas": ready, "observedGeneration": 1}
+        if any(rs["status"].get(k) != v for k, v in st.items()):
+            rs["status"] = st
+            self.store.put(rs)
+
+    def _create_pod(self, rs, name=None, labels=None, node=None):
+        tmpl = rs["spec"]["template"]
+        pod = {
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {
+                "name": name or "{}-{}".format(rs["metadata"]["name"], uuid.uuid4().hex[:5]),
+                "namespace": rs["metadata"]["namespace"],
+                "uid": str(uuid.uuid4()),
+                "labels": dict(tmpl["metadata"].get("labels", {}), **(labels or {})),
+                "annotations": dict(tmpl["metadata"].get("annotations", {})),
+                "ownerReferences": [self._owner_ref(rs)],
+                "creationTimestamp": now(),
+            },
+            "spec": dict(copy.deepcopy(tmpl["spec"]), **({"nodeName": node} if node else {})),
+            "status": {
+                "phase": "Pending",
+                "containerStatuses": [
+                    {
+                        "name": c["name"],
+                        "image": c.get("image"),
+                        "ready": False,
+                        "restartCount": 0,
+                        "state": {"waiting": {"reason": "ContainerCreating"}},
+                    }
+                    for c in tmpl["spec"]["containers"]
+                ],
+            },
+            "_created": time.time(),
+        }
+        pod["_fail"] = pod["metadata"]["annotations"].get(FAIL_ANN) or (self.fail and self.fail(pod))
+        if not self._schedule(pod):
+            pod["_fail"] = "unschedulable"
+        self.store.put(pod)
+
+    def _revision(self, owner):
+        """the ControllerRevision of the owner's current pod template (created, or made the latest again)"""
+        tmpl = owner["spec"]["template"]
+        h = template_hash(tmpl)
+        revs = self._owned("ControllerRevision", owner)
+        top = max([r["revision"] for r in revs] + [0])
+        rev = next((r for r in revs if r["metadata"]["labels"].get(REVISION_HASH) == h), None)
+        if rev is None:
+            rev = {
+                "apiVersion": "apps/v1",
+                "kind": "ControllerRevision",
+                "metadata": {
+                    "name": "{}-{}".format(owner["metadata"]["name"], h),
+                    "namespace": owner["metadata"]["namespace"],
+                    "uid": str(uuid.uuid4()),
+                    "labels": dict(tmpl["metadata"].get("labels", {}), **{REVISION_HASH: h}),
+                    "ownerReferences": [self._owner_ref(owner)],
+                },
+                "data": {"spec": {"template": dict(copy.deepcopy(tmpl), **{"$patch": "replace"})}},
+                "revision": top + 1,
+            }
+            self.store.put(rev)
+        elif rev["revision"] < top:
+            rev["revision"] = top + 1
+            self.store.put(rev)
+        return rev
+
+    def _reconcile_statefulset(self, sts):
+        name = sts["metadata"]["name"]
+        update_rev = self._revision(sts)["metadata"]["name"]
+        want = sts["spec"]["replicas"]
+        pods = {p["metadata"]["name"]: p for p in self._owned("Pod", sts)}
+        ordinal = {n: int(n.rpartition("-")[2]) for n in pods}
+        # OrderedReady: the first missing pod is created once all pods before it are ready
+        for i in range(want):
+            pod = pods.get("{}-{}".format(name, i))
+            if pod is None:
+                self._create_pod(sts, name="{}-{}".format(name, i), labels={REVISION_HASH: update_rev})
+                break
+            if not self._pod_ready(pod):
+                break
+        else:
+            extra = sorted((n for n in pods if ordinal[n] >= want), key=ordinal.get, reverse=True)
+            old = [
+                n
+                for n in sorted(pods, key=ordinal.get, reverse=True)
+                if pods[n]["metadata"]["labels"].get(REVISION_HASH) != update_rev
+            ]
+            if all(self._pod_ready(p) for p in pods.values()) and (extra or old):
+                self.store.delete("Pod", sts["metadata"]["namespace"], (extra or old)[0])
+        pods = [p for p in self._owned("Pod", sts) if ordinal.get(p["metadata"]["name"], 0) < want]
+        ready = sum(1 for p in pods if self._pod_ready(p))
+        updated = sum(1 for p in pods if p["metadata"]["labels"].get(REVISION_HASH) == update_rev)
+        st = sts["status"]
+        current = st.get("currentRevision", update_rev)
+        if updated == want and ready == want and len(self._owned("Pod", sts)) == want:
+            current = update_rev
+        new = {
+            "observedGeneration": sts["metadata"]["generation"],
+            "replicas": len(self._owned("Pod", sts)),
+            "readyReplicas": ready,
+            "availableReplicas": ready,
+            "updatedReplicas": updated,
+            "currentReplicas": sum(1 for p in pods if p["metadata"]["labels"].get(REVISION_HASH) == current),
+            "currentRevision": current,
+            "updateRevision": update_rev,
+        }
+        if any(st.get(k) != v for k, v in new.items()):
+            st.update(new)
+            self.store.put(sts)
+
+    def _reconcile_daemonset(self, ds):
+        ns = ds["metadata"]["namespace"]
+        tmpl = ds["spec"]["template"]
+        ann = ds["metadata"].setdefault("annotations", {})
+        if ds.get("_template") != template_hash(tmpl):  # the API server bumps this on each template change
+            ds["_template"] = template_hash(tmpl)
+            ann[TEMPLATE_GENERATION] = str(int(ann.get(TEMPLATE_GENERATION, 0)) + 1)
+        h = self._revision(ds)["metadata"]["labels"][REVISION_HASH]
+        sel = tmpl["spec"].get("nodeSelector") or {}
+        nodes = [
+            n["metadata"]["name"]
+            for n in self.store.list("Node")
+            if all(n["metadata"]["labels"].get(k) == v for k, v in sel.items())
+        ]
+        pods = self._owned("Pod", ds)
+        by_node = {p["spec"].get("nodeName"): p for p in pods}
+        for pod in pods:
+            if pod["spec"].get("nodeName") not in nodes:  # misscheduled
+                self.store.delete("Pod", ns, pod["metadata"]["name"])
+        labels = {REVISION_HASH: h, "pod-template-generation": ann[TEMPLATE_GENERATION]}
+        for node in nodes:
+            if node not in by_node:
+                self._create_pod(ds, labels=labels, node=node)
+        pods = [p for p in self._owned("Pod", ds) if p["spec"].get("nodeName") in nodes]
+        old = [p for p in pods if p["metadata"]["labels"].get(REVISION_HASH) != h]
+        for pod in old:  # old pods that aren't ready are replaced right away, the others one at a time
+            if not self._pod_ready(pod):
+                self.store.delete("Pod", ns, pod["metadata"]["name"])
+        if old and len(pods) == len(nodes) and all(self._pod_ready(p) for p in pods):
+            self.store.delete("Pod", ns, old[0]["metadata"]["name"])
+        pods = self._owned("Pod", ds)
+        ready = sum(1 for p in pods if self._pod_ready(p) and p["spec"].get("nodeName") in nodes)
+        new = {
+            "observedGeneration": ds["metadata"]["generation"],
+            "desiredNumberScheduled": len(nodes),
+            "currentNumberScheduled": sum(1 for p in pods if p["spec"].get("nodeName") in nodes),
+            "numberMisscheduled": sum(1 for p in pods if p["spec"].get("nodeName") not in nodes),
+            "updatedNumberScheduled": sum(1 for p in pods if p["metadata"]["labels"].get(REVISION_HASH) == h),
+            "numberReady": ready,
+            "numberAvailable": ready,
+            "numberUnavailable": len(nodes) - ready,
+        }
+        if any(ds["status"].get(k) != v for k, v in new.items()):
+            ds["status"].update(new)
+            self.store.put(ds)
+
+    def _workload_complete(self, obj):
+        st = obj["status"]
+        if st.get("observedGeneration") != obj["metadata"]["generation"]:
+            return False
+        if obj["kind"] == "StatefulSet":
+            want = obj["spec"]["replicas"]
+            return (
+                st["readyReplicas"] == want and st["replicas"] == want and st["currentRevision"] == st["updateRevision"]
+            )
+        want = st["desiredNumberScheduled"]
+        return st["updatedNumberScheduled"] == want and st["numberAvailable"] == want and not st["numberMisscheduled"]
+
+    def _reconcile_pod(self, pod):
+        age = time.time() - pod.get("_created", 0)
+        if age < self.pod_start_delay:
+            return
+        fail = pod["_fail"]
+        st = pod["status"]
+        if fail == "image-pull":
+            new = [
+                dict(cs, ready=False, state={"waiting": {"reason": "ImagePullBackOff"}})
+                for cs in st["containerStatuses"]
+            ]
+            phase = "Pending"
+            self._event(pod, "Failed", 'Failed to pull image "{}": not found'.format(new[0].get("image")))
+        elif fail == "crash":
+            restarts = int(age / max(self.pod_start_delay, 0.05))
+            new = [
+                dict(cs, ready=False, restartCount=restarts, state={"waiting": {"reason": "CrashLoopBackOff"}})
+                for cs in st["containerStatuses"]
+            ]
+            phase = "Running"
+            self._event(pod, "BackOff", "Back-off restarting failed container")
+        elif fail == "unschedulable":
+            if not st.get("conditions"):
+                msg = "0/1 nodes are available: 1 Insufficient cpu."
+                st["conditions"] = [
+                    {
+                        "type": "PodScheduled",
+                        "status": "False",
+                        "reason": "Unschedulable",
+                        "message": msg,
+                        "lastTransitionTime": now(),
+                    }
+                ]
+                self.store.put(pod)
+                self._event(pod, "FailedScheduling", msg)
+            return
+        else:
+            if fail == "late-scheduled" and not st.get("conditions"):
+                st["conditions"] = [{"type": "PodScheduled", "status": "True", "lastTransitionTime": now()}]
+            ready = fail != "never-ready"
+            if fail in ("late-scheduled", "pull-retried"):  # readiness takes 1s more (the events are seen first)
+                ready = age >= self.pod_start_delay + 1
+            new = [dict(cs, ready=ready, state={"running": {"startedAt": now()}}) for cs in st["containerStatuses"]]
+            phase = "Running"
+        if new != st["containerStatuses"] or phase != st["phase"]:
+            st["containerStatuses"] = new
+            st["phase"] = phase
+            self.store.put(pod)
+        # the problems the pod recovered from (before it started): only their events remain
+        if fail == "late-scheduled":
+            self._event(pod, "FailedScheduling", "0/1 nodes are available: 1 Insufficient cpu.", age=70)
+        elif fail == "pull-retried":
+            self._event(pod, "Failed", 'Failed to pull image "{}": i/o timeout'.format(new[0].get("image")))
+
+    def _event(self, obj, reason, message, age=0):
+        """add a Warning event about 'obj' (once for each reason), first reported 'age' seconds ago"""
+        if reason in obj.setdefault("_events", set()):
+            return
+        obj["_events"].add(reason)
+        md = obj["metadata"]
+        self.store.put(
+            {
+                "apiVersion": "v1",
+                "kind": "Event",
+                "metadata": {
+                    "name": "{}.{}".format(md["name"], uuid.uuid4().hex[:16]),
+                    "namespace": md["namespace"],
+                    "uid": str(uuid.uuid4()),
+                },
+                "involvedObject": {
+                    "kind": obj["kind"],
+                    "name": md["name"],
+                    "namespace": md["namespace"],
+                    "uid": md["uid"],
+                },
+                "reason": reason,
+                "message": message,
+                "type": "Warning",
+                "count": 1,
+                "firstTimestamp": now(age),
+                "lastTimestamp": now(),
+            }
+        )
+
+    @staticmethod
+    def _pod_ready(pod):
+        cs = pod["status"].get("containerStatuses", [])
+        return pod["status"].get("phase") == "Running" and cs and all(c["ready"] for c in cs)
+
+    def _dep_complete(self, dep):
+        st = dep["status"]
+        return (
+            st.get("observedGeneration") == dep["metadata"]["generation"]
+            and st.get("updatedReplicas", 0) == dep["spec"]["replicas"]
+            and st.get("replicas", 0) == dep["spec"]["replicas"]
+            and st.get("readyReplicas", 0) == dep["spec"]["replicas"]
+        )
+
+    def _update_quota_status(self, quota):
+        pods = [p for p in self.store.list("Pod", quota["metadata"]["namespace"]) if p["status"]["phase"] != "Failed"]
+        usage = {"pods": len(pods)}
+        for typ in ("requests", "limits"):
+            for r in ("cpu", "memory"):
+                usage["{}.{}".format(typ, r)] = sum(pod_requests(p["spec"], typ)[r] for p in pods)
+        usage["cpu"], usage["memory"] = usage["requests.cpu"], usage["requests.memory"]
+        used = {}
+        for k in quota["spec"]["hard"]:
+            if k in usage:
+                v = usage[k]
+                used[k] = "{:g}m".format(v * 1000) if k.endswith("cpu") else "{:g}".format(v)
+        if used != quota["status"]["used"]:
+            quota["status"]["used"] = used
+            self.store.put(quota)
+
+    @staticmethod
+    def _set_condition(dep, typ, status, reason, message):
+        conds = [c for c in dep["status"].get("conditions", []) if c["type"] != typ]
+        conds.append({"type": typ, "status": status, "reason": reason, "message": message, "lastUpdateTime": now()})
+        dep["status"]["conditions"] = conds
+
+    def _update_dep_status(self, dep):
+        h = template_hash(dep["spec"]["template"])
+        rss = self._owned("ReplicaSet", dep)
+        new_rs = next((r for r in rss if r["metadata"]["labels"].get("pod-template-hash") == h), None)
+        old = dict(dep["status"])
+        st = dep["status"]
+        st["replicas"] = sum(r["status"].get("replicas", 0) for r in rss)
+        st["updatedReplicas"] = new_rs["status"].get("replicas", 0) if new_rs else 0
+        st["readyReplicas"] = sum(r["status"].get("readyReplicas", 0) for r in rss)
+        st["availableReplicas"] = sum(r["status"].get("availableReplicas", 0) for r in rss)
+        st["unavailableReplicas"] = max(0, dep["spec"]["replicas"] - st["availableReplicas"])
+        if self._dep_complete(dep):
+            cur = next((c for c in st.get("conditions", []) if c["type"] == "Progressing"), {})
+            if cur.get("reason") != "NewReplicaSetAvailable":
+                self._set_condition(
+                    dep,
+                    "Progressing",
+                    "True",
+                    "NewReplicaSetAvailable",
+                    'ReplicaSet "{}" has successfully progressed.'.format(new_rs["metadata"]["name"]),
+                )
+            self._set_condition(
+                dep, "Available", "True", "MinimumReplicasAvailable", "Deployment has minimum availability."
+            )
+        if st != old:
+            self.store.put(dep)
+
+    # === HTTP API
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, code, data, typ):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                fake._count(typ, len(body))
+
+            def _error(self, code, msg, typ="error"):
+                self._send(code, {"kind": "Status", "status": "Failure", "message": msg, "code": code}, typ)
+
+            def _down(self):
+                """answer with a 503 error while the server is 'unavailable', return True if it did"""
+                if fake.unavailable:
+                    self._error(503, "service unavailable")
+                return fake.unavailable
+
+            def _route(self):
+                u = urlparse(self.path)
+                q = {k: v[0] for k, v in parse_qs(u.query).items()}
+                parts = u.path.strip("/").split("/")
+                # api/v1/namespaces/ns/pods[/name] or apis/apps/v1/namespaces/ns/deployments[/name]
+                if parts[0] == "api":
+                    group, rest = "api/v1", parts[2:]
+                else:
+                    group, rest = "/".join(parts[:3]), parts[3:]
+                if rest and rest[0] != "namespaces":
+                    # all namespaces or a cluster-scoped kind: api/v1/pods, api/v1/nodes[/name]
+                    kind = KINDS.get((group, rest[0]))
+                    return None if kind is None else (kind, None, rest[1] if len(rest) > 1 else None, q)
+                if len(rest) < 3:
+                    return None
+                kind = KINDS.get((group, rest[2]))
+                if kind is None:
+                    return None
+                return kind, rest[1], rest[3] if len(rest) > 3 else None, q
+
+            def do_GET(self):
+                if self._down():
+                    return
+                r = self._route()
+                if r is None:
+                    return self._error(404, "not found")
+                kind, ns, name, q = r
+                if kind in fake.forbidden:
+                    msg = '{} is forbidden: cannot list resource in namespace "{}"'.format(kind.lower() + "s", ns)
+                    return self._error(403, msg)
+                if q.get("watch") in ("1", "true"):
+                    return self._watch(kind, ns, q)
+                with fake.store.lock:
+                    if name:
+                        obj = fake.store.get(kind, ns, name)
+                        if obj is None:
+                            return self._error(404, '{} "{}" not found'.format(kind, name), "get")
+                        return self._send(200, clean(obj), "get")
+                    items = [
+                        clean(o)
+                        for o in fake.store.list(kind, ns)
+                        if match_labels(o, q.get("labelSelector")) and match_fields(o, q.get("fieldSelector"))
+                    ]
+                    if "as=PartialObjectMetadataList" in self.headers.get("Accept", ""):
+                        items = [{"kind": "PartialObjectMetadata", "metadata": o["metadata"]} for o in items]
+                        kind = "PartialObjectMetadata"
+                    data = {
+                        "apiVersion": API_VERSIONS.get(kind, "meta.k8s.io/v1"),
+                        "kind": kind + "List",
+                        "metadata": {"resourceVersion": str(fake.store.rv)},
+                        "items": items,
+                    }
+                self._send(200, data, "list")
+
+            def _watch(self, kind, ns, q):
+                rv = int(q.get("resourceVersion") or fake.store.rv)
+                t_end = time.time() + float(q.get("timeoutSeconds", 300))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                fake._count("watch", 0)
+
+                def chunk(line):
+                    self.wfile.write("{:x}\r\n".format(len(line)).encode() + line + b"\r\n")
+                    fake._count("watch-event", len(line))
+
+                try:
+                    with fake.stats_lock:
+                        broken = fake.broken_watches > 0
+                        fake.broken_watches -= broken
+                    if broken:
+                        # a connection lost while an event is sent: no terminating chunk
+                        chunk(b'{"type":"MODIFIED","object":{"kind":\n')
+                        self.wfile.flush()
+                        self.close_connection = True
+                        return
+                    if rv < fake.store.first_rv:
+                        status = {
+                            "kind": "Status",
+                            "status": "Failure",
+                            "code": 410,
+                            "message": "too old resource version",
+                        }
+                        chunk(json.dumps({"type": "ERROR", "object": status}).encode("utf-8") + b"\n")
+                        t_end = 0
+                    while not fake._stop.is_set() and not fake.unavailable and time.time() < t_end:
+                        with fake.store.lock:
+                            evs = [
+                                e
+                                for e in fake.store.events_after(rv)
+                                if e[2] == kind
+                                and ns in (None, e[3])
+                                and match_labels({"metadata": {"labels": e[4]}}, q.get("labelSelector"))
+                            ]
+                            if not evs:
+                                rv = max(rv, fake.store.rv)
+                                fake.store.cond.wait(min(0.5, max(0.0, t_end - time.time())))
+                                continue
+                            rv = evs[-1][0]
+                        for e in evs:
+                            chunk('{{"type":"{}","object":{}}}\n'.format(e[1], e[5]).encode("utf-8"))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_DELETE(self):
+                if self._down():
+                    return
+                r = self._route()
+                if r is None or r[2] is None:
+                    return self._error(404, "not found")
+                kind, ns, name, _ = r
+                with fake.store.lock:
+                    obj = fake.store.get(kind, ns, name)
+                    if obj is None:
+                        return self._error(404, '{} "{}" not found'.format(kind, name), "delete")
+                    fake.store.delete(kind, ns, name)
+                self._send(200, clean(obj), "delete")
+
+            def do_PATCH(self):
+                if self._down():
+                    return
+                r = self._route()
+                if r is None or r[2] is None:
+                    return self._error(404, "not found")
+                kind, ns, name, q = r
+                typ = "dry-run" if q.get("dryRun") == "All" else "patch"
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+                ctype = self.headers.get("Content-Type", "")
+                with fake.store.lock:
+                    obj = fake.store.get(kind, ns, name)
+                    if obj is None:
+                        return self._error(404, '{} "{}" not found'.format(kind, name), typ)
+                    try:
+                        if "json-patch" in ctype:
+                            new = json_patch(obj, body)
+                        elif "merge-patch" in ctype and "strategic" not in ctype:
+                            new = merge_patch(obj, body)
+                        else:
+                            new = strategic_merge(obj, body)
+                    except (ValueError, KeyError, IndexError, TypeError) as e:
+                        return self._error(422, "invalid patch: {}".format(e), typ)
+                    if kind in ("Deployment", "StatefulSet", "DaemonSet"):
+                        try:
+                            validate_deployment(new)
+                        except ValueError as e:
+                            return self._error(422, '{} "{}" is invalid: {}'.format(kind, name, e), typ)
+                    if kind == "HorizontalPodAutoscaler":
+                        if not 1 <= new["spec"].get("minReplicas", 1) <= new["spec"]["maxReplicas"]:
+                            msg = "spec.minReplicas must be between 1 and spec.maxReplicas"
+                            return self._error(422, '{} "{}" is invalid: {}'.format(kind, name, msg), typ)
+                    if new.get("spec") != obj.get("spec") and "generation" in obj["metadata"]:
+                        # (a copy: the patch result shares the parts it doesn't change with the stored object)
+                        new["metadata"] = dict(new["metadata"], generation=obj["metadata"]["generation"] + 1)
+                    if q.get("dryRun") != "All":
+                        fake.store.objects[(kind, ns, name)] = new
+                        if new != obj:
+                            fake.store.put(new)
+                    data = clean(new)
+                self._send(200, data, typ)
+
+        return Handler
+
+
+def clean(obj):
+    """copy of a stored object without the simulator's private keys"""
+    return {k: v for k, v in obj.items() if not k.startswith("_")}
@@ -57,8 +57,13 @@ def silent(cmd):
     subprocess.run(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False) # nosec
 
 # === 
+import contextlib
+import importlib.machinery
+import importlib.util
 import shutil
+import sys
 import tempfile
+import time
 import yaml
 
 
@@ -121,11 +126,12 @@ def copy_driver_files(tmpdirname, cfg):
         f.write(cfg)
 
 
-def run_driver(params, input=None):
+def run_driver(params, input=None, env=None):
     cmd = './adjust {}'.format(params)
     # nosec below as test suite is not intended to run in production environment, invocations all use static input
     try:
-        proc = subprocess.run(cmd, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, check=True) # nosec
+        proc = subprocess.run(cmd, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, check=True, # nosec
+                              env=env)
     except subprocess.CalledProcessError as cpe:
         raise Exception('Command "{}" returned exit status {} \n\nSTDOUT: {}\n\nSTDERR: {}'.format(cmd, cpe.returncode, cpe.stdout, cpe.stderr))
     assert proc.stdout
@@ -160,3 +166,69 @@ def adjust_dep(cfg, driver_input):
         finally:
             os.chdir(prevcwd)
         return result
+
+
+def fake_env(k8s, env=None):
+    """environment for running the driver against a fake_k8s.FakeK8s server, 'env' has additional variables"""
+    fenv = dict(os.environ)
+    fenv.update({'OPTUNE_K8S_CLIENT': 'api', 'OPTUNE_K8S_SERVER': k8s.url, 'OPTUNE_K8S_TOKEN': 'fake'})
+    fenv.update(env or {})
+    return fenv
+
+
+def fake_driver(k8s, cfg, params, driver_input=None, env=None):
+    """run the driver against a fake k8s API server, return a tuple (parsed_stdout, stderr, returncode)"""
+    if driver_input is not None:
+        driver_input = bytearray(json.dumps(driver_input).encode('utf-8'))
+    with tempfile.TemporaryDirectory() as dirname:
+        copy_driver_files(dirname, cfg)
+        prevcwd = os.getcwd()
+        os.chdir(dirname)
+        try:
+            return run_driver(params, input=driver_input, env=fake_env(k8s, env))
+        finally:
+            os.chdir(prevcwd)
+
+
+def write_files(dirname, files):
+    """create files under 'dirname' from a map {relative path: contents}, e.g., a stub encoder"""
+    for path, contents in (files or {}).items():
+        path = os.path.join(dirname, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(contents)
+
+
+@contextlib.contextmanager
+def fake_daemon(k8s, cfg, files=None):
+    """run the driver as a daemon ('./adjust --daemon') against a fake k8s API server, yield the environment that
+    makes driver invocations (see fake_driver()) forward their calls to it. 'files' are added to (or replace the
+    ones in) the driver's directory, see write_files()."""
+    with tempfile.TemporaryDirectory() as dirname:
+        copy_driver_files(dirname, cfg)
+        write_files(dirname, files)
+        sock = os.path.join(dirname, 'daemon.sock')
+        env = {'OPTUNE_K8S_DAEMON': sock}
+        proc = subprocess.Popen(['./adjust', '--daemon'], cwd=dirname, env=fake_env(k8s, env))
+        try:
+            for _ in range(100):
+                if os.path.exists(sock):
+                    break
+                time.sleep(0.1)
+            yield env
+        finally:
+            proc.terminate()
+            proc.wait(10)
+
+
+def load_driver():
+    """import the 'adjust' driver script as a module, for unit tests (the servo adjust.py module must be in the
+    repo root, like for running the driver)"""
+    root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    loader = importlib.machinery.SourceFileLoader('k8s_adjust', os.path.join(root, 'adjust'))
+    spec = importlib.util.spec_from_loader('k8s_adjust', loader)
+    mod = importlib.util.module_from_spec(spec)
+    loader.exec_module(mod)
+    return mod
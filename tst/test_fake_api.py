@@ -0,0 +1,674 @@
+# offline tests: run the driver against the in-process fake k8s API server (no minikube needed)
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+from fake_k8s import FakeK8s
+from helpers import fake_daemon, fake_driver, load_driver, write_files
+
+cfg = """
+k8s:
+  application:
+    components:
+      web:
+        settings:
+          cpu: {min: .1, max: 1, step: .1}
+          replicas: {min: 1, max: 5, step: 1}
+"""
+
+# a stand-in for encoders/base.py: a '-XX:<name>=<value>' option for each setting of the encoder config, the
+# calls are recorded in 'calls'
+ENCODER_STUB = r"""
+import re
+
+calls = []
+
+
+def describe(config, value):
+    calls.append(("describe", value))
+    opts = dict(re.findall(r"-XX:(\w+)=(\d+)", value))
+    return {n: dict(s, type="range", value=int(opts.get(n, s["min"]))) for n, s in config["settings"].items()}
+
+
+def encode(config, settings, expected_type=None):
+    calls.append(("encode", settings))
+    opts = ["-XX:{}={}".format(n, settings[n]["value"]) for n in sorted(settings)]
+    return (" ".join(opts) if expected_type is str else opts), sorted(settings)
+"""
+
+
+@pytest.fixture
+def k8s():
+    with FakeK8s(pod_start_delay=0.1) as k:
+        k.add_deployment("default", "web", replicas=2)
+        assert k.wait_stable()
+        yield k
+
+
+@pytest.fixture(scope="module")
+def driver():
+    """the driver, imported as a module (for the unit-level tests)"""
+    return load_driver()
+
+
+def test_query(k8s):
+    data, _, code = fake_driver(k8s, cfg, "--query default")
+    assert code == 0
+    settings = data["application"]["components"]["web"]["settings"]
+    assert settings["replicas"]["value"] == 2
+    assert data["monitoring"]["runtime_id"]
+    # deployment by name, one list of replicasets, pods and HPAs each
+    assert k8s.stats["requests"] <= 4
+
+
+def test_query_shared_namespace(k8s):
+    fake_driver(k8s, cfg, "--query default")
+    nbytes = k8s.stats["bytes"]
+    # unrelated applications in the same namespace should not add to the cost of a query
+    k8s.add_app("default", 50, replicas=2)
+    assert k8s.wait_stable()
+    k8s.reset_stats()
+    data, _, code = fake_driver(k8s, cfg, "--query default")
+    assert code == 0
+    assert k8s.stats["requests"] <= 4
+    assert k8s.stats["bytes"] <= nbytes * 1.1
+
+
+def test_query_refapp(k8s):
+    k8s.add_deployment("default", "web-ref", replicas=3, labels={"app": "web", "role": "ref"})
+    assert k8s.wait_stable()
+    # (no replicas setting: the reference app's replica count is read from the deployment)
+    rcfg = cfg.replace("k8s:", "k8s:\n  control: {userdata: {deployment: web-ref}}")
+    rcfg = rcfg.replace("          replicas: {min: 1, max: 5, step: 1}\n", "")
+    k8s.reset_stats()
+    data, _, code = fake_driver(k8s, rcfg, "--query default")
+    assert code == 0
+    mon = data["monitoring"]
+    assert mon["ref_spec_id"] == mon["spec_id"]
+    assert mon["ref_version_id"] == mon["version_id"]
+    assert mon["ref_runtime_count"] == 3
+    assert mon["ref_runtime_id"] != mon["runtime_id"]
+    # the reference app is read from the same objects as the application
+    assert k8s.stats["requests"] <= 4
+
+    # scaled by an HPA: the count is the HPA's minReplicas, like the value of the replicas setting
+    k8s.add_hpa("default", "web-ref", "web-ref", min_replicas=2, max_replicas=6)
+    data, _, code = fake_driver(
+        k8s, cfg.replace("k8s:", "k8s:\n  control: {userdata: {deployment: web-ref}}"), "--query default"
+    )
+    assert data["monitoring"]["ref_runtime_count"] == 2
+    assert k8s.store.get("Deployment", "default", "web-ref")["spec"]["replicas"] == 3
+
+
+def test_query_driver_options(k8s, driver):
+    # boolean options can be given as "0"/"1" strings, they are not returned by a query
+    bcfg = cfg.replace("k8s:", 'k8s:\n  preflight: "0"\n  concurrent_adjust: "1"')
+    desc = driver._read_desc(bcfg)
+    assert desc["preflight"] is False
+    assert desc["concurrent_adjust"] is True
+    data, _, code = fake_driver(k8s, bcfg, "--query default")
+    assert code == 0
+    assert "preflight" not in data
+    assert "concurrent_adjust" not in data
+
+
+def test_adjust(k8s):
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}, "replicas": {"value": 3}}}}}}
+    data, _, code = fake_driver(k8s, cfg, "default", inp)
+    assert code == 0
+    assert data["status"] == "ok"
+    dep = k8s.store.get("Deployment", "default", "web")
+    assert dep["spec"]["replicas"] == 3
+    assert dep["spec"]["template"]["spec"]["containers"][0]["resources"]["limits"]["cpu"] == "0.5"
+    assert dep["status"]["readyReplicas"] == 3
+
+
+def test_metrics(k8s, tmp_path):
+    trace = tmp_path / "trace.json"
+    mcfg = cfg.replace("k8s:", "k8s:\n  metrics: 1\n  metrics_trace: {}".format(trace))
+    data, _, code = fake_driver(k8s, mcfg, "--query default")
+    assert code == 0
+    assert "metrics" not in data["application"]
+    assert data["metrics"]["phases"]["query"]["api_calls"] == k8s.stats["requests"]
+    assert data["metrics"]["total"]["bytes"] == k8s.stats["bytes"]
+
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}}
+    data, _, code = fake_driver(k8s, mcfg, "default", inp)
+    assert code == 0
+    for phase in ("query", "patch", "generation_wait", "rollout_wait"):
+        assert data["metrics"]["phases"][phase]["count"] >= 1
+    assert data["metrics"]["deployments"]["web"]["patch"]["api_calls"] == 1
+    with open(str(trace)) as f:
+        assert [e["phase"] for e in json.load(f)["trace"]][-1] == "query"
+
+
+def test_adjust_noop(k8s):
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}}
+    fake_driver(k8s, cfg, "default", inp)
+    # the same settings again: the patch response shows no new generation, nothing to wait for
+    k8s.reset_stats()
+    data, stderr, code = fake_driver(k8s, cfg, "default", inp)
+    assert code == 0
+    assert data["status"] == "ok"
+    assert "waited" not in stderr
+    assert k8s.stats["by_type"].get("get", 0) <= 1
+
+
+def test_adjust_polling(k8s):
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}}
+    data, stderr, code = fake_driver(k8s, cfg, "default", inp, env={"OPTUNE_K8S_WATCH": "0"})
+    assert code == 0
+    assert data["status"] == "ok"
+    assert "polls saved" in stderr
+
+
+def test_adjust_broken_watch(k8s):
+    # the first watch streams are cut mid-event: the watches are re-started from a fresh list
+    k8s.broken_watches = 4
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}, "control": {"timeout": 60}}
+    t0 = time.time()
+    data, stderr, code = fake_driver(k8s, cfg, "default", inp)
+    assert code == 0
+    assert data["status"] == "ok"
+    assert time.time() - t0 < 20
+    assert k8s.broken_watches == 0
+    assert "re-trying" in stderr
+
+
+def test_adjust_failed_rollout(k8s):
+    k8s.fail = lambda pod: "crash"
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}, "control": {"timeout": 5}}
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg.replace("k8s:", "k8s:\n  on_fail: nop"), "default", inp)
+    assert "crash restart detected" in str(e.value)
+
+
+def test_adjust_image_pull_failure(k8s):
+    k8s.fail = lambda pod: "image-pull"
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}, "control": {"timeout": 60}}
+    t0 = time.time()
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg.replace("k8s:", "k8s:\n  on_fail: nop"), "default", inp)
+    # detected from the pod status/events, long before the timeout
+    assert time.time() - t0 < 20
+    assert "container image pull failure detected" in str(e.value)
+    assert "image-pull-failed" in str(e.value)
+
+
+@pytest.mark.parametrize("fail", ["late-scheduled", "pull-retried"])
+def test_adjust_recovered_pods(k8s, fail):
+    # the new pods were unschedulable for longer than UNSCHEDULABLE_GRACE, or failed a first image pull, and then
+    # started: their Warning events remain, but don't fail the rollout
+    k8s.fail = lambda pod: fail
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}, "control": {"settlement": 1}}
+    data, _, code = fake_driver(k8s, cfg, "default", inp)
+    assert code == 0
+    assert data["status"] == "ok"
+    assert len(k8s.store.list("Event", "default")) == 2
+
+
+def test_adjust_events_forbidden(k8s):
+    # the Warning events can't be read (not in the Role): the failure is detected from the pods' status
+    k8s.forbidden = {"Event"}
+    k8s.fail = lambda pod: "image-pull"
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}, "control": {"timeout": 60}}
+    t0 = time.time()
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg.replace("k8s:", "k8s:\n  on_fail: nop"), "default", inp)
+    assert time.time() - t0 < 20
+    assert "container image pull failure detected" in str(e.value)
+    assert "cannot watch events" in str(e.value)
+
+
+def test_adjust_rollback(k8s):
+    # only pods of the adjusted template fail, the rolled back (original) template starts normally
+    h0 = k8s.store.list("Pod", "default")[0]["metadata"]["labels"]["pod-template-hash"]
+    k8s.fail = lambda pod: "image-pull" if pod["metadata"]["labels"]["pod-template-hash"] != h0 else None
+    tmpl0 = k8s.store.get("Deployment", "default", "web")["spec"]["template"]
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}}}}}, "control": {"timeout": 60}}
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg, "default", inp)
+    assert "container image pull failure detected" in str(e.value)
+    assert "Rollback succeeded" in str(e.value)
+    # restored with a single patch (no kubectl rollout undo)
+    assert k8s.store.get("Deployment", "default", "web")["spec"]["template"] == tmpl0
+    assert k8s.stats["by_type"].get("patch") == 2
+    assert k8s.wait_stable()
+
+
+def test_adjust_statefulset_daemonset(k8s):
+    for i in range(2):
+        k8s.add_node("node-{}".format(i))
+    k8s.add_statefulset("default", "db", replicas=2)
+    k8s.add_daemonset("default", "agent")
+    assert k8s.wait_stable()
+    cfg2 = cfg + """      db:
+        kind: statefulset
+        settings:
+          cpu: {min: .1, max: 1, step: .1}
+          replicas: {min: 1, max: 5, step: 1}
+      agent:
+        kind: daemonset
+        settings:
+          cpu: {min: .1, max: 1, step: .1}
+"""
+    data, _, code = fake_driver(k8s, cfg2, "--query default")
+    assert data["application"]["components"]["db"]["settings"]["replicas"]["value"] == 2
+    assert "replicas" not in data["application"]["components"]["agent"]["settings"]
+
+    comps = {
+        "db": {"settings": {"cpu": {"value": 0.5}, "replicas": {"value": 3}}},
+        "agent": {"settings": {"cpu": {"value": 0.4}}},
+    }
+    data, _, code = fake_driver(k8s, cfg2, "default", {"application": {"components": comps}})
+    assert data["status"] == "ok"
+
+    def requests(prefix):
+        pods = k8s.store.list("Pod", "default")
+        return sorted(
+            p["spec"]["containers"][0]["resources"]["requests"]["cpu"]
+            for p in pods
+            if p["metadata"]["name"].startswith(prefix)
+        )
+
+    assert requests("db-") == ["0.5"] * 3
+    assert requests("agent-") == ["0.4"] * 2
+
+    # the crashing statefulset pod is deleted on rollback, so that the previous revision can replace it
+    k8s.fail = lambda pod: "crash" if pod["spec"]["containers"][0]["resources"]["requests"]["cpu"] == "0.7" else None
+    inp = {"application": {"components": {"db": {"settings": {"cpu": {"value": 0.7}}}}}, "control": {"timeout": 30}}
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg2, "default", inp)
+    assert "Rollback succeeded" in str(e.value)
+    k8s.fail = None
+    assert k8s.wait_stable()
+    assert requests("db-") == ["0.5"] * 3
+
+
+def test_adjust_multi_namespace(k8s):
+    # a deployment with the same name in another namespace
+    k8s.add_deployment("backend", "web", replicas=1)
+    assert k8s.wait_stable()
+    cfg2 = cfg.replace("k8s:", "k8s:\n  concurrent_adjust: true") + """      backend-web:
+        namespace: backend
+        deployment: web
+        settings:
+          cpu: {min: .1, max: 1, step: .1}
+"""
+    data, _, code = fake_driver(k8s, cfg2, "--query default")
+    assert data["application"]["components"]["backend-web"]["settings"]["cpu"]["value"] == 0.25
+    runtime_id = data["monitoring"]["runtime_id"]
+    # one lean query per namespace
+    assert k8s.stats["requests"] <= 8
+
+    k8s.add_quota("backend", "compute", {"requests.cpu": "0.5"})
+    time.sleep(0.5)  # for the quota usage to be updated
+    comps = {"web": {"settings": {"cpu": {"value": 0.5}}}, "backend-web": {"settings": {"cpu": {"value": 0.6}}}}
+    inp = {"application": {"components": comps}, "control": {"settlement": 2}}
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg2, "default", inp)
+    assert "backend:compute requests.cpu would be 0.6 (limit 0.5)" in str(e.value)
+
+    comps["backend-web"]["settings"]["cpu"]["value"] = 0.4
+    data, _, code = fake_driver(k8s, cfg2, "default", inp)
+    assert data["status"] == "ok"
+    assert data["monitoring"]["runtime_id"] != runtime_id
+    for namespace, cpu in (("default", "0.5"), ("backend", "0.4")):
+        pods = k8s.store.list("Pod", namespace)
+        assert pods and all(p["spec"]["containers"][0]["resources"]["requests"]["cpu"] == cpu for p in pods)
+
+
+def test_adjust_hpa(k8s):
+    k8s.add_hpa("default", "web", "web", min_replicas=2, max_replicas=6)
+    hcfg = cfg.replace("replicas: {min: 1, max: 5, step: 1}", "replicas: {step: 1}")
+    data, _, code = fake_driver(k8s, hcfg, "--query default")
+    # the HPA's minReplicas, in the HPA's range
+    replicas = data["application"]["components"]["web"]["settings"]["replicas"]
+    assert (replicas["value"], replicas["min"], replicas["max"]) == (2, 2, 6)
+
+    def scale_up():
+        # the HPA scales the deployment up during settlement, once the adjusted pods are running
+        t_end = time.time() + 20
+        while time.time() < t_end:
+            with k8s.store.lock:
+                pods = k8s.store.list("Pod", "default")
+                if len(pods) == 3 and all(
+                    p["spec"]["containers"][0]["resources"]["requests"]["cpu"] == "0.5" for p in pods
+                ):
+                    break
+            time.sleep(0.1)
+        time.sleep(0.5)
+        k8s.scale_hpa("default", "web", 5)
+
+    threading.Thread(target=scale_up).start()
+    comps = {"web": {"settings": {"cpu": {"value": 0.5}, "replicas": {"value": 3}}}}
+    data, _, code = fake_driver(
+        k8s, hcfg, "default", {"application": {"components": comps}, "control": {"settlement": 4}}
+    )
+    assert data["status"] == "ok"
+    hpa = k8s.store.get("HorizontalPodAutoscaler", "default", "web")
+    assert (hpa["spec"]["minReplicas"], hpa["spec"]["maxReplicas"]) == (3, 6)
+    assert k8s.store.get("Deployment", "default", "web")["spec"]["replicas"] == 5
+
+    data, _, code = fake_driver(k8s, hcfg, "--query default")
+    replicas = data["application"]["components"]["web"]["settings"]["replicas"]
+    assert (replicas["value"], replicas["min"], replicas["max"]) == (3, 2, 6)
+
+
+def test_settlement_destroy(k8s):
+    k8s.add_deployment("default", "api", replicas=2)
+    assert k8s.wait_stable()
+    cfg2 = cfg.replace("k8s:", "k8s:\n  on_fail: destroy") + """      api:
+        settings:
+          cpu: {min: .1, max: 1, step: .1}
+"""
+    comps = {"web": {"settings": {"cpu": {"value": 0.5}}}, "api": {"settings": {"cpu": {"value": 0.5}}}}
+    inp = {"application": {"components": comps}, "control": {"settlement": 4}}
+
+    def delete_pod():
+        # a pod restart during settlement fails the adjustment
+        time.sleep(2)
+        with k8s.store.lock:
+            pod = k8s.store.list("Pod", "default")[0]
+            k8s.store.delete("Pod", "default", pod["metadata"]["name"])
+
+    threading.Thread(target=delete_pod).start()
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg2, "default", inp)
+    assert "intentional restart detected. Destroy succeeded" in str(e.value)
+    for name in ("web", "api"):
+        assert k8s.store.get("Deployment", "default", name)["spec"]["replicas"] == 0
+
+
+def test_adjust_invalid_patch(k8s):
+    k8s.add_deployment("default", "api", replicas=1)
+    assert k8s.wait_stable()
+    cfg2 = cfg + """      api:
+        settings:
+          cpu: {min: .1, max: 1, step: .1}
+"""
+    # the patch for 'api' is invalid: it is rejected by the dry run, before 'web' is changed
+    comps = {"web": {"settings": {"cpu": {"value": 0.5}}}, "api": {"settings": {"cpu": {"value": -1}}}}
+    inp = {"application": {"components": comps}}
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg2, "default", inp)
+    assert "rejected (dry run)" in str(e.value)
+    assert k8s.store.get("Deployment", "default", "web")["metadata"]["generation"] == 1
+    assert "patch" not in k8s.stats["by_type"]
+
+    comps["api"]["settings"]["cpu"]["value"] = 0.5
+    data, _, code = fake_driver(k8s, cfg2.replace("k8s:", "k8s:\n  concurrent_adjust: true"), "default", inp)
+    assert data["status"] == "ok"
+    assert k8s.stats["by_type"]["dry-run"] == 4
+    assert k8s.stats["by_type"]["patch"] == 2
+
+
+def test_adjust_insufficient_capacity(k8s):
+    # web's 2 pods (0.25 cpu each) were created without a node, db's pod is scheduled to the node
+    k8s.add_node("node-1", cpu="1", memory="4Gi")
+    k8s.add_deployment("other", "db", replicas=1)
+    assert k8s.wait_stable()
+    # 3 x 0.5 cpu don't fit next to db: rejected up front, instead of a rollout stuck with a Pending pod
+    inp = {"application": {"components": {"web": {"settings": {"cpu": {"value": 0.5}, "replicas": {"value": 3}}}}}}
+    with pytest.raises(Exception) as e:
+        fake_driver(k8s, cfg, "default", inp)
+    assert "insufficient-resources" in str(e.value)
+    assert "2 of 3 replica(s) of web with cpu 0.5, memory 256Mi" in str(e.value)
+    assert "patch" not in k8s.stats["by_type"]
+
+    # 3 x 0.25 cpu do
+    inp["application"]["components"]["web"]["settings"]["cpu"]["value"] = 0.25
+    data, _, code = fake_driver(k8s, cfg, "default", inp)
+    assert data["status"] == "ok"
+    assert all(p["spec"].get("nodeName") == "node-1" for p in k8s.store.list("Pod", "default"))
+
+
+def test_adjust_quota(k8s):
+    k8s.add_quota("default", "compute", {"requests.cpu": "1", "limits.memory": "2Gi", "pods": "10"})
+    k8s.add_limit_range("default", "limits", [{"type": "Container", "max": {"cpu": "800m"}}])
+    time.sleep(0.5)  # for the quota usage to be updated
+
+    def adjust(cpu, replicas):
+        inp = {
+            "application": {
+                "components": {"web": {"settings": {"cpu": {"value": cpu}, "replicas": {"value": replicas}}}}
+            }
+        }
+        return fake_driver(k8s, cfg, "default", inp)
+
+    # 2 x 0.25 cpu are in use, 3 x 0.5 would be over the quota
+    with pytest.raises(Exception) as e:
+        adjust(0.5, 3)
+    assert "quota-exceeded" in str(e.value)
+    assert "compute requests.cpu would be 1.5 (limit 1)" in str(e.value)
+    with pytest.raises(Exception) as e:
+        adjust(0.9, 1)
+    assert "limit-range-violated" in str(e.value)
+    assert "web: container main cpu 0.9 is above the maximum 800m" in str(e.value)
+    assert "patch" not in k8s.stats["by_type"]
+
+    data, _, code = adjust(0.5, 2)
+    assert data["status"] == "ok"
+
+
+def test_daemon(k8s):
+    with fake_daemon(k8s, cfg) as env:
+        data0, _, code = fake_driver(k8s, cfg, "--query default", env=env)
+        assert code == 0
+        # the daemon serves queries from its cache, once it is warm
+        k8s.reset_stats()
+        data, stderr, code = fake_driver(k8s, cfg, "--query default", env=env)
+        assert code == 0
+        assert data == data0
+        assert k8s.stats["requests"] == k8s.stats["by_type"].get("watch-event", 0)
+
+        inp = {"application": {"components": {"web": {"settings": {"replicas": {"value": 3}}}}}}
+        data, _, code = fake_driver(k8s, cfg, "default", inp, env=env)
+        assert code == 0
+        assert data["status"] == "ok"
+        assert k8s.store.get("Deployment", "default", "web")["spec"]["replicas"] == 3
+        data, _, code = fake_driver(k8s, cfg, "--query default", env=env)
+        assert data["application"]["components"]["web"]["settings"]["replicas"]["value"] == 3
+
+
+def test_daemon_watch_outage(k8s):
+    with fake_daemon(k8s, cfg) as env:
+        fake_driver(k8s, cfg, "--query default", env=env)
+        # the API server is down for a while (the watches back off) and the deployment changes meanwhile
+        k8s.unavailable = True
+        dep = json.loads(json.dumps(k8s.store.get("Deployment", "default", "web")))
+        dep["spec"]["replicas"] = 4
+        dep["metadata"]["generation"] += 1
+        k8s.store.put(dep)
+        time.sleep(4)
+        k8s.unavailable = False
+        # the daemon doesn't serve the stale cache, the watches are re-started from fresh lists
+        data, _, code = fake_driver(k8s, cfg, "--query default", env=env)
+        assert code == 0
+        assert data["application"]["components"]["web"]["settings"]["replicas"]["value"] == 4
+
+
+def test_daemon_encoder_cache(k8s):
+    k8s.add_deployment(
+        "default",
+        "java",
+        containers=[
+            {"name": "main", "image": "openjdk:11", "env": [{"name": "JAVA_OPTS", "value": "-XX:GCTimeRatio=69"}]}
+        ],
+    )
+    assert k8s.wait_stable()
+    jcfg = """
+k8s:
+  metrics: 1
+  application:
+    components:
+      java:
+        env:
+          JAVA_OPTS:
+            encoder:
+              name: jvm
+              settings:
+                GCTimeRatio: {min: 9, max: 99, step: 10}
+"""
+    with fake_daemon(k8s, jcfg, files={"encoders/base.py": ENCODER_STUB}) as env:
+        data, _, code = fake_driver(k8s, jcfg, "--query default", env=env)
+        assert code == 0
+        assert data["application"]["components"]["java"]["settings"]["GCTimeRatio"]["value"] == 69
+        assert data["metrics"]["phases"]["encoder_describe"]["count"] == 1
+        # the same JAVA_OPTS value is not described again
+        data2, _, code = fake_driver(k8s, jcfg, "--query default", env=env)
+        assert data2["application"] == data["application"]
+        assert "encoder_describe" not in data2["metrics"]["phases"]
+
+
+def test_encoder_registry(driver, tmp_path, monkeypatch):
+    write_files(str(tmp_path), {"encoders/__init__.py": "", "encoders/base.py": ENCODER_STUB})
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ("encoders", "encoders.base"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    reg = driver.EncoderRegistry(size=2)
+    config = {"name": "stub", "settings": {"GCTimeRatio": {"min": 9, "max": 99, "step": 10}}}
+    desc = reg.describe(config, "-XX:GCTimeRatio=69")
+    calls = reg.base.calls
+    assert desc["GCTimeRatio"]["value"] == 69
+    # the cached result is a copy, the caller can modify the one returned
+    desc["GCTimeRatio"]["value"] = 19
+    assert reg.describe(config, "-XX:GCTimeRatio=69")["GCTimeRatio"]["value"] == 69
+    assert len(calls) == 1
+    # the least recently used result is evicted first
+    reg.describe(config, "-XX:GCTimeRatio=19")
+    reg.describe(config, "-XX:GCTimeRatio=69")
+    reg.describe(config, "-XX:GCTimeRatio=29")
+    del calls[:]
+    reg.describe(config, "-XX:GCTimeRatio=69")
+    assert calls == []
+    reg.describe(config, "-XX:GCTimeRatio=19")
+    assert calls == [("describe", "-XX:GCTimeRatio=19")]
+    # encode(): by settings and expected type
+    del calls[:]
+    settings = {"GCTimeRatio": {"value": 39}}
+    value, names = reg.encode(config, settings, expected_type=list)
+    assert (value, names) == (["-XX:GCTimeRatio=39"], ["GCTimeRatio"])
+    value.append("-Xmx1g")
+    names.append("Xmx")
+    assert reg.encode(config, settings, expected_type=list) == (["-XX:GCTimeRatio=39"], ["GCTimeRatio"])
+    assert reg.encode(config, settings, expected_type=str) == ("-XX:GCTimeRatio=39", ["GCTimeRatio"])
+    assert len(calls) == 2
+
+
+def test_query_result_is_a_copy(k8s, driver, monkeypatch):
+    monkeypatch.setattr(driver, "_client", driver.KubeClient(k8s.url, token="fake"))
+    qcfg = cfg + """        env:
+          MODE: {type: enum, values: [a, b], default: a}
+  custom: {nested: [1, 2]}
+"""
+    desc = driver.Descriptor(driver._read_desc(qcfg))
+    orig = json.dumps(desc, sort_keys=True)
+    out, _, _ = driver.raw_query("default", desc)
+    first = json.dumps(out, sort_keys=True)
+
+    def modify(obj):
+        for v in list(obj.values() if isinstance(obj, dict) else obj):
+            if isinstance(v, (dict, list)):
+                modify(v)
+        if isinstance(obj, dict):
+            obj["x"] = 1
+        else:
+            obj.append(1)
+
+    # the caller can modify the result: the (cached, shared) descriptor is not changed
+    modify(out)
+    assert json.dumps(desc, sort_keys=True) == orig
+    assert json.dumps(driver.raw_query("default", desc)[0], sort_keys=True) == first
+
+
+def test_update_progress(driver, monkeypatch):
+    class Clock(object):
+        t = 0.0
+
+        def time(self):
+            return self.t
+
+    clock = Clock()
+    monkeypatch.setattr(driver, "time", clock)
+    sent = []
+    progress = driver.UpdateProgress(["web", "api"], lambda value, msg: sent.append((value, msg)), settlement=10)
+    ro = driver.Rollout("web", 2)
+    ro.state = "progressing"
+
+    def update(t, updated, value):
+        clock.t = t
+        ro.latest = {"spec": {"replicas": 4}, "status": {"replicas": 4, "updatedReplicas": updated}}
+        ro.progress = value
+        progress.rollout("web", ro)
+
+    update(0, 2, 0.5)
+    assert sent == [(20, "rollout 0/2 done; web 2/4 updated; api pending")]
+    # rate limited: at most one message every PROGRESS_MIN_INTERVAL seconds
+    update(0.5, 3, 0.75)
+    assert len(sent) == 1
+    update(1, 3, 0.75)
+    assert sent[-1] == (30, "rollout 0/2 done; web 3/4 updated; api pending")
+    # the value never decreases; an unchanged message is repeated every PROGRESS_HEARTBEAT seconds only
+    update(2, 3, 0.25)
+    update(5.5, 3, 0.25)
+    assert len(sent) == 2
+    update(6, 3, 0.25)
+    assert sent[-1] == sent[-2]
+    # no change in the replica counts (since t=0.5) for PROGRESS_STALL seconds
+    update(20.5, 3, 0.75)
+    assert sent[-1] == (30, "rollout 0/2 done; web 3/4 updated (no change for 20s); api pending")
+    clock.t = 22
+    progress.done("api")
+    assert sent[-1][0] == 70
+    ro.state = "complete"
+    update(23, 4, 1.0)
+    assert sent[-1] == (80, "rollout 2/2 done")
+    # the settlement takes SETTLEMENT_SHARE of the progress, the value stays below 100
+    clock.t = 24
+    progress.settlement(5)
+    assert sent[-1] == (90, "rollout 2/2 done; settlement 5s/10s")
+    clock.t = 25
+    progress.settlement(10)
+    assert sent[-1] == (99, "rollout 2/2 done; settlement 10s/10s")
+
+
+def test_read_desc_cache(driver, tmp_path, monkeypatch):
+    path = tmp_path / "config.yaml"
+    monkeypatch.setattr(driver, "DESC_FILE", str(path))
+    monkeypatch.delenv("OPTUNE_USE_DRIVER_NAME", raising=False)
+    monkeypatch.setattr(driver, "_desc_cache", {})
+    parsed = []
+    read = driver._read_desc
+    monkeypatch.setattr(driver, "_read_desc", lambda data: parsed.append(data) or read(data))
+
+    def write(text, mtime):
+        path.write_text(text)
+        os.utime(str(path), ns=(mtime * 10**9, mtime * 10**9))
+
+    write(cfg, 1)
+    desc = driver.read_desc()
+    assert desc["application"]["components"]["web"]["settings"]["replicas"]["max"] == 5
+    assert driver.read_desc() is desc
+    assert len(parsed) == 1
+    # touched, but not changed: re-read, not parsed again
+    write(cfg, 2)
+    assert driver.read_desc() is desc
+    assert len(parsed) == 1
+    # changed
+    write(cfg.replace("max: 5", "max: 6"), 3)
+    desc = driver.read_desc()
+    assert desc["application"]["components"]["web"]["settings"]["replicas"]["max"] == 6
+    assert len(parsed) == 2
+    # a changed file that isn't valid: the error is raised on every call, the previous contents are not used
+    write(cfg.replace("      web:\n", "      web:\n        kind: job\n"), 4)
+    for _ in range(2):
+        with pytest.raises(driver.ConfigError) as e:
+            driver.read_desc()
+        assert "unsupported kind" in str(e.value)
+    write(cfg, 5)
+    assert driver.read_desc()["application"]["components"]["web"]["settings"]["replicas"]["max"] == 5